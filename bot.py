@@ -2,12 +2,16 @@ import os
 import time
 import logging
 import json
+import queue
+import re
 import sqlite3
 import threading
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+import requests
+import urllib3
 import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -26,18 +30,25 @@ bot = TeleBot(TELEGRAM_BOT_TOKEN)
 class LoggerSetup:
     @staticmethod
     def setup_logger(base_path="/tmp/tiktok_logs"):
+        lg = logging.getLogger(__name__)
+        if lg.handlers:
+            return lg  # tekrar çağrıda handler birikmesin
+
         log_dir = base_path
         os.makedirs(log_dir, exist_ok=True)
-        
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(os.path.join(log_dir, f"download_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")),
-                logging.StreamHandler()
-            ]
-        )
-        return logging.getLogger(__name__)
+
+        lg.setLevel(logging.INFO)
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        for handler in (
+            logging.FileHandler(os.path.join(log_dir, f"download_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")),
+            logging.StreamHandler()
+        ):
+            handler.setFormatter(formatter)
+            lg.addHandler(handler)
+        return lg
+
+# Manager'lardan önce hazır olmalı: DB metodları logger.error kullanıyor
+logger = LoggerSetup.setup_logger()
 
 # ============ KONFİGÜRASYON YÖNETICISI ============
 class ConfigManager:
@@ -67,101 +78,199 @@ class ConfigManager:
         }
     
     def save_config(self):
-        with open(self.config_file, 'w') as f:
+        # Önce tmp'ye yaz, sonra rename: yarım yazılmış config dosyası kalmaz
+        tmp_file = self.config_file + ".tmp"
+        with open(tmp_file, 'w') as f:
             json.dump(self.config, f, indent=4)
-    
+        os.replace(tmp_file, self.config_file)
+
     def get(self, key, default=None):
         return self.config.get(key, default)
-    
+
     def set(self, key, value):
         self.config[key] = value
         self.save_config()
 
+    def update(self, **kwargs):
+        # Birden fazla anahtar tek dosya yazımıyla güncellenir
+        self.config.update(kwargs)
+        self.save_config()
+
 # ============ VERİTABANI YÖNETICISI ============
 class DatabaseManager:
     def __init__(self, base_path="/tmp/tiktok_db"):
         os.makedirs(base_path, exist_ok=True)
         self.db_path = os.path.join(base_path, "downloads.db")
+        # Tek kalıcı bağlantı: her işlemde connect/close yapmak yerine
+        # bir kez açılır, thread'ler arasında lock ile paylaşılır
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute("PRAGMA cache_size=-20000")
+        # Başarılı indirmelerin bellek içi cache'i (lazy yüklenir)
+        self._downloaded_cache = None
         self.init_database()
-    
+        # Tekil yazmalar kuyruğa atılır, flusher thread 500 ms'de bir toplu commit eder
+        self._write_q = queue.Queue()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            rows = [self._write_q.get()]
+            time.sleep(0.5)
+            while True:
+                try:
+                    rows.append(self._write_q.get_nowait())
+                except queue.Empty:
+                    break
+            self.mark_many(rows)
+
     def init_database(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS downloads (
-                id INTEGER PRIMARY KEY,
-                video_id TEXT UNIQUE,
-                username TEXT,
-                url TEXT,
-                status TEXT,
-                download_date TIMESTAMP,
-                file_path TEXT
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS telegram_users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                downloads_count INTEGER DEFAULT 0,
-                join_date TIMESTAMP
-            )
-        ''')
-        conn.commit()
-        conn.close()
-    
+        with self._lock:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS downloads (
+                    id INTEGER PRIMARY KEY,
+                    video_id TEXT UNIQUE,
+                    username TEXT,
+                    url TEXT,
+                    status TEXT,
+                    download_date TIMESTAMP,
+                    file_path TEXT
+                )
+            ''')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS telegram_users (
+                    user_id INTEGER PRIMARY KEY,
+                    username TEXT,
+                    downloads_count INTEGER DEFAULT 0,
+                    join_date TIMESTAMP
+                )
+            ''')
+            # Tablo büyüdükçe tam tarama yerine B-tree araması
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_downloads_vid_status ON downloads(video_id, status)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_downloads_status ON downloads(status)')
+
     def mark_as_downloaded(self, video_id, username, url, status, file_path=""):
+        # Kuyruğa atıp hemen döner; disk'e yazma flusher thread'de toplanır.
+        # Çökme anında son birkaç satırın kaybı tolere edilir (tekrar indirilir).
+        with self._lock:
+            if self._downloaded_cache is not None:
+                if status == "success":
+                    self._downloaded_cache.add(video_id)
+                else:
+                    self._downloaded_cache.discard(video_id)
+        self._write_q.put((video_id, username, url, status, file_path))
+
+    def mark_many(self, rows):
+        # rows: (video_id, username, url, status, file_path) listesi
+        # Tek transaction = N fsync yerine 1 fsync
+        if not rows:
+            return
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO downloads 
-                (video_id, username, url, status, download_date, file_path)
-                VALUES (?, ?, ?, ?, datetime('now'), ?)
-            ''', (video_id, username, url, status, file_path))
-            conn.commit()
-            conn.close()
+            with self._lock:
+                self._conn.execute("BEGIN")
+                try:
+                    self._conn.executemany('''
+                        INSERT OR REPLACE INTO downloads
+                        (video_id, username, url, status, download_date, file_path)
+                        VALUES (?, ?, ?, ?, datetime('now'), ?)
+                    ''', rows)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                if self._downloaded_cache is not None:
+                    for video_id, _, _, status, _ in rows:
+                        if status == "success":
+                            self._downloaded_cache.add(video_id)
+                        else:
+                            self._downloaded_cache.discard(video_id)
         except Exception as e:
             logger.error(f"Database error: {e}")
-    
+
+    def _ensure_cache(self):
+        # Çağıran lock tutmalı
+        if self._downloaded_cache is None:
+            cursor = self._conn.execute('SELECT video_id FROM downloads WHERE status = "success"')
+            self._downloaded_cache = {row[0] for row in cursor.fetchall()}
+
+    def load_downloaded_ids(self):
+        # Batch başında tek toplu sorgu; link başına nokta sorgusu yerine
+        try:
+            with self._lock:
+                self._ensure_cache()
+                return set(self._downloaded_cache)
+        except Exception as e:
+            logger.error(f"Database error: {e}")
+            return set()
+
     def is_already_downloaded(self, video_id):
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM downloads WHERE video_id = ? AND status = "success"', (video_id,))
-            result = cursor.fetchone()
-            conn.close()
-            return result is not None
+            with self._lock:
+                self._ensure_cache()
+                return video_id in self._downloaded_cache
         except:
             return False
-    
+
     def get_download_stats(self):
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM downloads WHERE status = "success"')
-            success = cursor.fetchone()[0]
-            cursor.execute('SELECT COUNT(*) FROM downloads WHERE status = "failed"')
-            failed = cursor.fetchone()[0]
-            conn.close()
-            return success, failed
+            with self._lock:
+                cursor = self._conn.execute('SELECT status, COUNT(*) FROM downloads GROUP BY status')
+                counts = dict(cursor.fetchall())
+            return counts.get("success", 0), counts.get("failed", 0)
         except:
             return 0, 0
-    
+
     def add_telegram_user(self, user_id, username):
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR IGNORE INTO telegram_users (user_id, username, join_date)
-                VALUES (?, ?, datetime('now'))
-            ''', (user_id, username))
-            conn.commit()
-            conn.close()
+            with self._lock:
+                self._conn.execute('''
+                    INSERT OR IGNORE INTO telegram_users (user_id, username, join_date)
+                    VALUES (?, ?, datetime('now'))
+                ''', (user_id, username))
         except Exception as e:
             logger.error(f"Error adding telegram user: {e}")
 
 # ============ CHROME YÖNETICISI (HEADLESS OPTIMIZED) ============
 class ChromeManager:
+    # Sıcak sürücü havuzu: Chrome cold-start maliyeti komutlar arasında amorti edilir
+    _pool = None
+    _pool_lock = threading.Lock()
+
+    @classmethod
+    def acquire(cls, config):
+        with cls._pool_lock:
+            if cls._pool is None:
+                cls._pool = queue.Queue(maxsize=config.get("max_workers", 2))
+        try:
+            return cls._pool.get_nowait()
+        except queue.Empty:
+            return cls.create_driver(config)
+
+    @classmethod
+    def release(cls, driver):
+        try:
+            # Havuza dönmeden savunmacı temizlik: önceki işin izleri sızmasın
+            driver.delete_all_cookies()
+            driver.get("about:blank")
+        except Exception:
+            # Temizlenemeyen sürücü büyük ihtimalle ölü; havuzu zehirleme
+            try:
+                driver.quit()
+            except:
+                pass
+            return
+        try:
+            cls._pool.put_nowait(driver)
+        except queue.Full:
+            try:
+                driver.quit()
+            except:
+                pass
+
     @staticmethod
     def create_driver(config):
         options = uc.ChromeOptions()
@@ -173,30 +282,112 @@ class ChromeManager:
         options.add_argument("--disable-gpu")
         options.add_argument("--window-size=1920,1080")
         options.add_argument("--disable-extensions")
-        
+
+        # İndirme akışında görsel/font/bildirim gereksiz; sayfa yükü küçülür
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument("--disable-features=Translate,MediaRouter,OptimizationHints")
+        options.add_argument("--disable-background-networking")
+        options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.fonts": 2,
+            "profile.default_content_setting_values.notifications": 2
+        })
+
         if config.get("use_proxy") and config.get("proxy_server"):
             options.add_argument(f"--proxy-server={config.get('proxy_server')}")
         
         try:
             driver = uc.Chrome(
                 options=options,
-                use_subprocess=True,
+                use_subprocess=False,  # ara process gereksiz; başlatmayı hızlandırır
                 headless=True
             )
         except Exception as e:
             logger.error(f"Chrome başlatma hatası (Binary hatası olabilir): {e}")
             raise
         
+        # Selenium'un chromedriver bağlantı havuzu varsayılan 1; çoklu thread
+        # altında "connection pool is full" uyarıları ve yeniden bağlanmalar oluyor
+        try:
+            driver.command_executor._conn = urllib3.PoolManager(maxsize=config.get("max_workers", 2) * 4)
+        except Exception as e:
+            logger.error(f"Bağlantı havuzu ayarlanamadı: {e}")
+
+        # Analitik/izleme istekleri sayfanın hazır olmasını geciktiriyor
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": [
+                "*google-analytics*", "*googletagmanager*", "*doubleclick*",
+                "*facebook.net*", "*hotjar*", "*sentry*"
+            ]})
+        except Exception as e:
+            logger.error(f"CDP URL engelleme ayarlanamadı: {e}")
+
         driver.set_page_load_timeout(config.get("timeout", 25))
+        driver._dl_path = None  # Page.setDownloadBehavior cache'i (download_single_video)
         return driver
 
+# ============ İLERLEME BİLDİRİCİ ============
+class ProgressNotifier:
+    # İlerleme mesajlarını birleştirir: en fazla interval saniyede bir,
+    # yalnızca en güncel durum gönderilir (her 5 indirmede bir HTTPS isteği yerine)
+    def __init__(self, chat_id, interval=3):
+        self.chat_id = chat_id
+        self.interval = interval
+        self._pending = None
+        self._event = threading.Event()
+        self._stopped = False
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def update(self, success, total):
+        self._pending = (success, total)
+        self._event.set()
+
+    def stop(self):
+        self._stopped = True
+        self._event.set()
+
+    def _worker(self):
+        while not self._stopped:
+            self._event.wait()
+            self._event.clear()
+            if self._stopped:
+                break
+            time.sleep(self.interval)  # bu pencerede gelen güncellemeler birleşir
+            pending, self._pending = self._pending, None
+            if pending:
+                success, total = pending
+                try:
+                    bot.send_message(self.chat_id, f"✅ {success}/{total} indirildi...")
+                except Exception as e:
+                    logger.error(f"Telegram message error: {e}")
+
 # ============ İNDİRME MOTORU ============
+# Input alanına değeri tek JS çağrısıyla yazar; input+change event'leri
+# framework'lerin değişikliği görmesi için gerekli
+_SET_INPUT_JS = "arguments[0].value = arguments[1]; arguments[0].dispatchEvent(new Event('input', { bubbles: true })); arguments[0].dispatchEvent(new Event('change', { bubbles: true }));"
+
+# Link bileşenleri tek regex geçişinde çıkarılır (split zinciri yerine)
+_LINK_RE = re.compile(r"https?://[^/]+/@(?P<user>[^/]+)/(?P<kind>video|photo)/(?P<vid>[^/?]+)")
+
+def _parse_link(link):
+    # (username, is_photo, video_id) döner
+    m = _LINK_RE.match(link)
+    if m:
+        return m.group("user"), m.group("kind") == "photo", m.group("vid")
+    # vm.tiktok.com gibi kısa linkler kalıba uymaz; eski split davranışı korunur
+    video_id = link.split('/')[-1].split('?')[0]
+    username = link.split('@')[1].split('/')[0] if '@' in link else "user"
+    return username, "/photo/" in link, video_id
+
 class TikTokDownloader:
     def __init__(self, config_manager, db_manager):
         self.config_manager = config_manager
         self.db_manager = db_manager
         self.base_path = config_manager.get("download_path")
         os.makedirs(self.base_path, exist_ok=True)
+        # Daha önce oluşturulan klasörler için makedirs çağrısı atlanır
+        self._known_dirs = set()
     
     def send_telegram_message(self, chat_id, message):
         try:
@@ -204,42 +395,134 @@ class TikTokDownloader:
         except Exception as e:
             logger.error(f"Telegram message error: {e}")
     
+    @staticmethod
+    def _dir_set(path):
+        # İsim kümesi: sayı karşılaştırması yerine küme farkı, yarım dosyalar ayıklanabilir
+        if not os.path.exists(path):
+            return set()
+        return {e.name for e in os.scandir(path)}
+
+    def _new_complete_files(self, save_dir, before_files):
+        # before_files'a göre yeni ve tamamlanmış (.crdownload olmayan) dosyalar
+        return {n for n in self._dir_set(save_dir) - before_files if not n.endswith('.crdownload')}
+
+    def wait_for_download(self, driver, save_dir, before_files, timeout=30):
+        # Sabit sleep yerine tamamlanmış yeni bir dosya görünene kadar yokla
+        try:
+            WebDriverWait(driver, timeout).until(
+                lambda d: self._new_complete_files(save_dir, before_files)
+            )
+        except Exception:
+            pass  # Asıl başarı kontrolü download_single_video sonunda yapılıyor
+
+    def download_video_api(self, link, save_dir, video_id, timeout=None):
+        # tikwm JSON API'si doğrudan MP4 URL'si döner; tarayıcıya gerek yok
+        if timeout is None:
+            timeout = self.config_manager.get("timeout", 25)
+        resp = requests.post("https://www.tikwm.com/api/", data={"url": link}, timeout=timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        play_url = (data.get("data") or {}).get("play")
+        if not play_url:
+            raise Exception(f"API yanıtında video URL'si yok: {data.get('msg')}")
+        file_path = os.path.join(save_dir, f"{video_id}.mp4")
+        with requests.get(play_url, stream=True, timeout=timeout) as dl:
+            dl.raise_for_status()
+            with open(file_path, "wb") as f:
+                for chunk in dl.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+        logger.info(f"İndirildi (API): {link}")
+        return file_path
+
+    def download_one(self, link, chat_id=None):
+        # Tek linklik /download için hızlı yol: batch kurulumu ve max_workers
+        # kadar sürücü yerine API denemesi + havuzdan tek sıcak sürücü yeter
+        username, is_photo, video_id = _parse_link(link)
+        save_dir = os.path.join(self.base_path, username)
+        if save_dir not in self._known_dirs:
+            os.makedirs(save_dir, exist_ok=True)
+            self._known_dirs.add(save_dir)
+
+        if self.db_manager.is_already_downloaded(video_id):
+            if chat_id:
+                self.send_telegram_message(chat_id, "✅ Bu video zaten indirilmiş.")
+            return True
+
+        ok = False
+        try:
+            if not is_photo:
+                try:
+                    self.download_video_api(link, save_dir, video_id)
+                    ok = True
+                except Exception as e:
+                    logger.error(f"API indirme hatası, Selenium'a dönülüyor: {e}")
+            if not ok:
+                driver = ChromeManager.acquire(self.config_manager)
+                try:
+                    self.download_single_video(driver, link, save_dir, video_id, is_photo, username)
+                    ok = True
+                finally:
+                    ChromeManager.release(driver)
+        except Exception:
+            logger.error(f"Failed: {link}")
+
+        self.db_manager.mark_as_downloaded(video_id, username, link, "success" if ok else "failed")
+        if chat_id:
+            if ok:
+                self.send_telegram_message(chat_id, "✅ <b>İndirme Tamamlandı!</b>")
+            else:
+                self.send_telegram_message(chat_id, "❌ <b>İndirme başarısız oldu.</b>")
+        return ok
+
+    def _run_download(self, link, save_dir, video_id, is_photo, username, timeout=None):
+        # Videolar için önce hafif API yolu; slideshow'lar tarayıcı ister
+        if not is_photo:
+            try:
+                self.download_video_api(link, save_dir, video_id, timeout)
+                return True
+            except Exception as e:
+                logger.error(f"API indirme hatası, Selenium'a dönülüyor: {e}")
+        # Sürücüler thread-safe değil ve ancak gerektiğinde alınır: API yolunu
+        # kullanan batch'ler Chrome'a hiç dokunmaz (eşzamanlılığı executor sınırlar)
+        driver = ChromeManager.acquire(self.config_manager)
+        try:
+            return self.download_single_video(driver, link, save_dir, video_id, is_photo, username, timeout)
+        finally:
+            ChromeManager.release(driver)
+
     @retry(stop=stop_after_attempt(2), wait=wait_exponential(multiplier=1, min=2, max=5))
-    def download_single_video(self, driver, link, save_dir, video_id, is_photo, username):
+    def download_single_video(self, driver, link, save_dir, video_id, is_photo, username, timeout=None):
         try:
-            before_count = len(os.listdir(save_dir)) if os.path.exists(save_dir) else 0
-            driver.execute_cdp_cmd("Page.setDownloadBehavior", {"behavior": "allow", "downloadPath": save_dir})
+            if timeout is None:
+                timeout = self.config_manager.get("timeout", 25)
+            before_files = self._dir_set(save_dir)
+            # CDP komutu process'ler arası IPC; hedef klasör değişmediyse tekrarlanmaz
+            if getattr(driver, '_dl_path', None) != save_dir:
+                driver.execute_cdp_cmd("Page.setDownloadBehavior", {"behavior": "allow", "downloadPath": save_dir})
+                driver._dl_path = save_dir
 
             if is_photo:
                 driver.get("https://imaiger.com/tool/tiktok-slideshow-downloader")
-                time.sleep(6)
-                wait = WebDriverWait(driver, self.config_manager.get("timeout", 25))
+                wait = WebDriverWait(driver, timeout)
                 p_in = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "input")))
-                driver.execute_script("arguments[0].value = ''; arguments[0].focus();", p_in)
-                for char in link:
-                    p_in.send_keys(char)
-                    time.sleep(0.01)
+                driver.execute_script(_SET_INPUT_JS, p_in, link)
                 try:
                     driver.execute_script("arguments[0].click();", driver.find_element(By.XPATH, "//button[contains(., 'Load')]"))
                 except:
                     p_in.send_keys(Keys.ENTER)
-                time.sleep(5)
                 driver.execute_script("arguments[0].click();", wait.until(EC.presence_of_element_located((By.XPATH, "//button[contains(text(), 'Download All')]"))))
-                time.sleep(5)
+                self.wait_for_download(driver, save_dir, before_files)
             else:
                 driver.get("https://www.tikwm.com/originalDownloader.html")
-                wait = WebDriverWait(driver, self.config_manager.get("timeout", 25))
+                wait = WebDriverWait(driver, timeout)
                 input_f = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input#url, .form-control")))
-                js_script = "arguments[0].value = arguments[1]; arguments[0].dispatchEvent(new Event('input', { bubbles: true })); arguments[0].dispatchEvent(new Event('change', { bubbles: true }));"
-                driver.execute_script(js_script, input_f, link)
-                time.sleep(2)
+                driver.execute_script(_SET_INPUT_JS, input_f, link)
                 driver.execute_script("arguments[0].click();", wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "button#search_btn"))))
                 dl_btn = wait.until(EC.presence_of_element_located((By.XPATH, "//a[contains(@class, 'download') and contains(@href, 'tikwm.com')]")))
                 driver.execute_script("arguments[0].click();", dl_btn)
-                time.sleep(6)
+                self.wait_for_download(driver, save_dir, before_files)
 
-            if os.path.exists(save_dir) and len(os.listdir(save_dir)) > before_count:
-                self.db_manager.mark_as_downloaded(video_id, username, link, "success")
+            if self._new_complete_files(save_dir, before_files):
                 logger.info(f"İndirildi: {link}")
                 return True
             else:
@@ -248,97 +531,204 @@ class TikTokDownloader:
             logger.error(f"Download error: {e}")
             raise
     
-    def scrape_user(self, username):
+    def scrape_user_http(self, username):
+        # Chrome açmadan profil HTML'inden linkleri topla
+        user = username.lstrip("@")
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "Accept-Language": "en-US,en;q=0.9",
+        }
+        try:
+            resp = requests.get(f"https://www.tiktok.com/@{user}", headers=headers,
+                                timeout=self.config_manager.get("timeout", 25))
+            resp.raise_for_status()
+            html = resp.text
+            # Tür korunmalı: foto postlar /photo/ olarak dönmeli ki
+            # slideshow akışına yönlensin
+            pairs = re.findall(r'/(video|photo)/(\d+)', html)
+            if not pairs:
+                # JS ile render edilen sayfalarda liste SIGI_STATE JSON'unda gömülü
+                m = re.search(r'<script id="SIGI_STATE"[^>]*>(.*?)</script>', html, re.DOTALL)
+                if m:
+                    data = json.loads(m.group(1))
+                    pairs = [("photo" if item.get("imagePost") else "video", vid)
+                             for vid, item in data.get("ItemModule", {}).items()]
+            seen = {}
+            for kind, vid in pairs:
+                if vid not in seen:
+                    seen[vid] = f"https://www.tiktok.com/@{user}/{kind}/{vid}"
+            links = list(seen.values())
+            logger.info(f"HTTP scrape: {len(links)} link bulundu")
+            return links
+        except Exception as e:
+            logger.error(f"HTTP scrape hatası: {e}")
+            return []
+
+    def _extract_embedded_items(self, driver, username):
+        # Profil sayfası video listesini ilk yüklemede JSON blob olarak gömüyor;
+        # bir kez parse etmek N scroll-render-sleep turundan hem hızlı hem güvenilir
+        try:
+            raw = driver.execute_script(
+                "var el = document.getElementById('__UNIVERSAL_DATA_FOR_REHYDRATION__')"
+                " || document.getElementById('SIGI_STATE');"
+                "return el ? el.textContent : null;"
+            )
+            if not raw:
+                return []
+            data = json.loads(raw)
+            # imagePost taşıyan kayıtlar /photo/ linki almalı ki slideshow
+            # akışına yönlensin
+            links = [
+                f"https://www.tiktok.com/{username}/{'photo' if item.get('imagePost') else 'video'}/{vid}"
+                for vid, item in data.get("ItemModule", {}).items()
+            ]
+            if not links:
+                # __UNIVERSAL_DATA__ düzeninde id'ler daha derinde gömülü;
+                # tür bilgisi yok, /video/ en iyi tahmin
+                item_ids = re.findall(r'"id"\s*:\s*"(\d{15,})"', raw)
+                links = [f"https://www.tiktok.com/{username}/video/{vid}" for vid in dict.fromkeys(item_ids)]
+            return links
+        except Exception as e:
+            logger.error(f"Gömülü JSON parse hatası: {e}")
+            return []
+
+    def iter_scrape_user(self, username):
+        # Her turda yeni bulunan linkleri batch olarak yield eder; tüketici
+        # scrape bitmeden indirmeye başlayabilir (üretici-tüketici)
+        links = self.scrape_user_http(username)
+        if links:
+            yield links
+            return
+
         driver = None
         try:
-            driver = ChromeManager.create_driver(self.config_manager)
+            driver = ChromeManager.acquire(self.config_manager)
             if not username.startswith("@"):
                 username = "@" + username
-            
+
             driver.get(f"https://www.tiktok.com/{username}")
-            time.sleep(6)
-            
-            found_links = set()
+            try:
+                WebDriverWait(driver, self.config_manager.get("timeout", 25)).until(
+                    EC.presence_of_element_located((By.XPATH, "//a[contains(@href, '/video/') or contains(@href, '/photo/')]"))
+                )
+            except:
+                pass  # profil boş olabilir; gömülü JSON yine de denenir
+
+            embedded = self._extract_embedded_items(driver, username)
+            if embedded:
+                logger.info(f"Scrape başarılı (gömülü JSON): {len(embedded)} link bulundu")
+                yield embedded
+                return
+
+            # video_id üzerinden dedupe: aynı videonun büyük/küçük harf veya
+            # sondaki slash varyantları tek kayda iner; indirilmişler hiç girmez
+            downloaded_ids = self.db_manager.load_downloaded_ids()
+            seen_ids = {}
             scroll_count = self.config_manager.get("scrape_scroll_count", 5)
-            
+            found = 0
+
             for _ in range(scroll_count):
-                elements = driver.find_elements(By.XPATH, "//a[contains(@href, '/video/') or contains(@href, '/photo/')]")
-                for el in elements:
-                    href = el.get_attribute("href")
-                    if href:
-                        found_links.add(href.split("?")[0])
+                # Tüm href'ler tek JS çağrısıyla gelir; element başına
+                # get_attribute round-trip'i yapılmaz
+                hrefs = driver.execute_script(
+                    "return Array.from(document.querySelectorAll(\"a[href*='/video/'],a[href*='/photo/']\")).map(a => a.href);"
+                )
+                batch = []
+                for href in hrefs:
+                    if not href:
+                        continue
+                    clean = href.split("?")[0]
+                    vid = clean.rstrip("/").split("/")[-1]
+                    if vid not in seen_ids and vid not in downloaded_ids:
+                        seen_ids[vid] = clean
+                        batch.append(clean)
+                if batch:
+                    found += len(batch)
+                    yield batch
                 driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
                 time.sleep(3)
-            
-            logger.info(f"Scrape başarılı: {len(found_links)} link bulundu")
-            return list(found_links)
+
+            logger.info(f"Scrape başarılı: {found} link bulundu")
         except Exception as e:
             logger.error(f"Scrape hatası: {e}")
-            return []
         finally:
             if driver:
-                driver.quit()
+                ChromeManager.release(driver)
+
+    def scrape_user(self, username):
+        links = []
+        for batch in self.iter_scrape_user(username):
+            links.extend(batch)
+        return links
     
     def download_videos(self, links, chat_id=None):
         total = len(links)
         success_count = 0
         fail_count = 0
         failed_links = []
-        drivers = [] # UnboundLocalError önlemek için liste en başta tanımlanmalı
-        
+        results = [] # DB'ye tek seferde yazılacak satırlar
+
+
+        notifier = None
         if chat_id:
             self.send_telegram_message(chat_id, f"⏳ <b>{total}</b> video indirme başlatılıyor...")
-        
+            notifier = ProgressNotifier(chat_id)
+
         try:
+            # Sıcak döngüde tekrar tekrar dict okumak yerine bir kez locale al
             max_workers = self.config_manager.get("max_workers", 1)
-            # Sürücüleri oluştur
-            drivers = [ChromeManager.create_driver(self.config_manager) for _ in range(max_workers)]
-            
+            delay = self.config_manager.get("delay_between_downloads", 3)
+            timeout = self.config_manager.get("timeout", 25)
+
+            # Link başına SELECT yerine batch başında tek toplu sorgu
+            downloaded_ids = self.db_manager.load_downloaded_ids()
+
             with ThreadPoolExecutor(max_workers=max_workers) as executor:
                 futures = {}
-                
-                for index, link in enumerate(links):
-                    driver = drivers[index % max_workers]
-                    
-                    video_id = link.split('/')[-1].split('?')[0]
-                    is_photo = "/photo/" in link
-                    username = link.split('@')[1].split('/')[0] if '@' in link else "user"
+
+                for link in links:
+                    username, is_photo, video_id = _parse_link(link)
                     save_dir = os.path.join(self.base_path, username)
-                    os.makedirs(save_dir, exist_ok=True)
+                    if save_dir not in self._known_dirs:
+                        os.makedirs(save_dir, exist_ok=True)
+                        self._known_dirs.add(save_dir)
 
-                    if self.db_manager.is_already_downloaded(video_id):
+                    if video_id in downloaded_ids:
                         success_count += 1
                         continue
+                    downloaded_ids.add(video_id)  # batch içi tekrarları da eler
 
                     future = executor.submit(
-                        self.download_single_video,
-                        driver, link, save_dir, video_id, is_photo, username
+                        self._run_download,
+                        link, save_dir, video_id, is_photo, username, timeout
                     )
-                    futures[future] = (link, username)
+                    futures[future] = (link, username, video_id)
                     
-                    time.sleep(self.config_manager.get("delay_between_downloads", 3))
+                    time.sleep(delay)
 
                 for future in as_completed(futures):
-                    link, username = futures[future]
+                    link, username, video_id = futures[future]
                     try:
                         future.result()
                         success_count += 1
-                        if chat_id and success_count % 5 == 0:
-                            self.send_telegram_message(chat_id, f"✅ {success_count}/{total} indirildi...")
+                        results.append((video_id, username, link, "success", ""))
+                        if notifier:
+                            notifier.update(success_count, total)
                     except Exception as e:
                         fail_count += 1
                         failed_links.append(link)
-                        video_id = link.split('/')[-1].split('?')[0]
-                        self.db_manager.mark_as_downloaded(video_id, username, link, "failed")
+                        results.append((video_id, username, link, "failed", ""))
                         logger.error(f"Failed: {link}")
+                    # Uzun batch'lerde ara ara flush: çökme anında ilerleme kaybolmaz
+                    if len(results) >= 50:
+                        self.db_manager.mark_many(results)
+                        results.clear()
         finally:
-            # Sürücüleri güvenli kapat
-            for d in drivers:
-                try:
-                    d.quit()
-                except:
-                    pass
-            
+            # Tüm batch sonuçları tek transaction ile yazılır
+            self.db_manager.mark_many(results)
+
+            if notifier:
+                notifier.stop()
             if chat_id:
                 telegram_msg = f"✅ <b>İndirme Tamamlandı!</b>\n\n📊 <b>Sonuçlar:</b>\n✅ Başarılı: <b>{success_count}</b>\n❌ Hatalı: <b>{fail_count}</b>"
                 self.send_telegram_message(chat_id, telegram_msg)
@@ -346,6 +736,9 @@ class TikTokDownloader:
             return success_count, fail_count, failed_links
 
 # ============ TELEGRAM HANDLERS ============
+# Komut başına yeni thread açmak yerine ortak havuz kullanılır
+TASK_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tt-job")
+
 @bot.message_handler(commands=['start'])
 def handle_start(message):
     chat_id = message.chat.id
@@ -384,7 +777,7 @@ def process_download_link(message, chat_id):
         bot.send_message(chat_id, "❌ <b>Geçerli bir TikTok linki gönder!</b>", parse_mode='HTML')
         return
     
-    threading.Thread(target=downloader.download_videos, args=([link], chat_id), daemon=True).start()
+    TASK_POOL.submit(downloader.download_one, link, chat_id)
 
 def process_scrape_user(message, chat_id):
     username = message.text.strip()
@@ -392,21 +785,72 @@ def process_scrape_user(message, chat_id):
     
     def run_scrape():
         bot.send_message(chat_id, f"⏳ <b>{username}</b> videoları toplanıyor...", parse_mode='HTML')
-        links = downloader.scrape_user(username)
-        if links:
-            bot.send_message(chat_id, f"✅ <b>{len(links)}</b> video bulundu, indirme başlıyor...", parse_mode='HTML')
-            downloader.download_videos(links, chat_id)
-        else:
-            bot.send_message(chat_id, "❌ Video bulunamadı.", parse_mode='HTML')
+        # Üretici-tüketici: her scroll'un linkleri scrape sürerken indirilmeye
+        # başlar. Ayrı yerel havuz: TASK_POOL worker'ı içinde TASK_POOL future'ı
+        # beklemek eşzamanlı scrape'lerde kilitlenebilirdi.
+        futures = []
+        found = 0
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="tt-batch") as batch_pool:
+            for batch in downloader.iter_scrape_user(username):
+                if found == 0:
+                    bot.send_message(chat_id, f"✅ İlk <b>{len(batch)}</b> video bulundu, indirme başlıyor...", parse_mode='HTML')
+                found += len(batch)
+                futures.append(batch_pool.submit(downloader.download_videos, batch))
+
+            if not futures:
+                bot.send_message(chat_id, "❌ Video bulunamadı.", parse_mode='HTML')
+                return
+
+            success = fail = 0
+            for future in futures:
+                try:
+                    s, f, _ = future.result()
+                    success += s
+                    fail += f
+                except Exception as e:
+                    logger.error(f"Batch indirme hatası: {e}")
+        bot.send_message(chat_id, f"✅ <b>İndirme Tamamlandı!</b>\n\n📊 <b>Sonuçlar:</b>\n✅ Başarılı: <b>{success}</b>\n❌ Hatalı: <b>{fail}</b>", parse_mode='HTML')
             
-    threading.Thread(target=run_scrape, daemon=True).start()
+    TASK_POOL.submit(run_scrape)
 
 # ============ START ============
+def run_webhook(webhook_url, port):
+    # Telegram güncellemeleri push eder: sürekli getUpdates döngüsü yerine
+    # tek bir POST endpoint'i dinlenir
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from telebot import types
+
+    webhook_path = f"/webhook/{TELEGRAM_BOT_TOKEN}"
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != webhook_path:
+                self.send_response(404)
+                self.end_headers()
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            update = types.Update.de_json(self.rfile.read(length).decode("utf-8"))
+            bot.process_new_updates([update])
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass  # erişim logları gereksiz gürültü
+
+    bot.remove_webhook()
+    bot.set_webhook(url=webhook_url.rstrip("/") + webhook_path)
+    ThreadingHTTPServer(("0.0.0.0", port), WebhookHandler).serve_forever()
+
 if __name__ == "__main__":
     logger = LoggerSetup.setup_logger()
     config_manager = ConfigManager()
     db_manager = DatabaseManager()
     downloader = TikTokDownloader(config_manager, db_manager)
-    
-    print("\n✅ Bot Choreo üzerinde başlatıldı!\n")
-    bot.infinity_polling()
+
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if webhook_url:
+        print("\n✅ Bot webhook modunda başlatıldı!\n")
+        run_webhook(webhook_url, int(os.getenv("PORT", "8080")))
+    else:
+        print("\n✅ Bot Choreo üzerinde başlatıldı!\n")
+        bot.infinity_polling()